@@ -1,30 +1,79 @@
-from flask import Flask, request, jsonify
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from urllib.parse import quote_plus
+from flask import Blueprint, Flask, current_app, request, jsonify
 import os
+import sys
 
-app = Flask(__name__)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config import setting
+from config.sql import execute
 
-# Database configuration
-DB_USER = os.environ.get('DB_USER', 'postgres')
-DB_PASSWORD = os.environ.get('DB_PASSWORD', 'password')
-DB_HOST = os.environ.get('DB_HOST', 'localhost')
-DB_PORT = os.environ.get('DB_PORT', '5432')
-DB_NAME = os.environ.get('DB_NAME', 'joy_of_painting')
+# SQLAlchemy is imported on the first query (see config.sql.execute), so booting
+# the app (or serving /api/months) does not pay for it
 
-# Create connection string
-password = quote_plus(DB_PASSWORD)
-connection_string = f"postgresql://{DB_USER}:{password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(connection_string)
-Session = sessionmaker(bind=engine)
+api = Blueprint('api', __name__)
+
+def create_app(config=None):
+    """
+    Build the Flask app. `config` overrides the defaults from config/setting.py.
+    No database connection is made here unless WARM_UP is set.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        DB_PRIMARY_URL=setting.DB_PRIMARY_URL,
+        DB_REPLICA_URLS=setting.DB_REPLICA_URLS,
+        DB_HEALTH_CHECK_INTERVAL=setting.DB_HEALTH_CHECK_INTERVAL,
+        DB_LAG_RECHECK_INTERVAL=setting.DB_LAG_RECHECK_INTERVAL,
+        DB_READ_YOUR_WRITES=setting.DB_READ_YOUR_WRITES,
+        WARM_UP=setting.API_WARM_UP,
+        WARM_UP_CONNECTIONS=setting.API_WARM_UP_CONNECTIONS,
+    )
+    if config:
+        app.config.update(config)
+    app.register_blueprint(api)
+
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+def get_router():
+    """Return the app's database router, built from app.config on first use."""
+    router = current_app.extensions.get('router')
+    if router is None:
+        from config.database import DatabaseRouter
+        config = current_app.config
+        # Engines are created lazily, so a losing racer here costs nothing
+        router = current_app.extensions.setdefault('router', DatabaseRouter(
+            config['DB_PRIMARY_URL'],
+            config['DB_REPLICA_URLS'],
+            health_check_interval=config['DB_HEALTH_CHECK_INTERVAL'],
+            read_your_writes=config['DB_READ_YOUR_WRITES'],
+            lag_recheck_interval=config['DB_LAG_RECHECK_INTERVAL'],
+        ))
+    return router
+
+def warm_up(app):
+    """Open pooled connections and prime the lookup queries before the worker takes traffic."""
+    with app.app_context():
+        get_router().warm_up(app.config['WARM_UP_CONNECTIONS'])
+    client = app.test_client()
+    for path in ('/api/colors', '/api/subjects'):
+        response = client.get(path)
+        if response.status_code != 200:
+            print(f"Warm-up request {path} failed with status {response.status_code}")
+
+def read_session():
+    """
+    Open a read session on a replica.
+    Clients that just ran a load can send X-Dataset-Generation to read their own writes.
+    """
+    min_generation = request.headers.get('X-Dataset-Generation', type=int)
+    return get_router().read_session(min_generation)
 
 def get_episodes_by_filters(filters, filter_type="AND"):
     """
     Get episodes based on filters.
     filter_type can be "AND" (all filters must match) or "OR" (any filter can match)
     """
-    session = Session()
+    session = read_session()
 
     query = """
     SELECT e.id, e.title, e.season_number, e.episode_number, e.air_date, e.youtube_url, e.image_url,
@@ -96,7 +145,7 @@ def get_episodes_by_filters(filters, filter_type="AND"):
 
     query += " ORDER BY e.season_number, e.episode_number"
 
-    result = session.execute(text(query), params)
+    result = execute(session, query, params)
 
     episodes = []
     for row in result:
@@ -116,11 +165,11 @@ def get_episodes_by_filters(filters, filter_type="AND"):
     return episodes
 
 # --- ROUTES ---
-@app.route('/')
+@api.route('/')
 def index():
     return "Joy of Painting API is running."
 
-@app.route('/api/episodes', methods=['GET', 'POST'])
+@api.route('/api/episodes', methods=['GET', 'POST'])
 def get_episodes():
     if request.method == 'GET':
         months = request.args.getlist('month')
@@ -144,23 +193,23 @@ def get_episodes():
     episodes = get_episodes_by_filters(filters, filter_type.upper())
     return jsonify(episodes)
 
-@app.route('/api/colors', methods=['GET'])
+@api.route('/api/colors', methods=['GET'])
 def get_colors():
-    session = Session()
-    result = session.execute(text("SELECT id, name, hex_code FROM Color ORDER BY name"))
+    session = read_session()
+    result = execute(session, "SELECT id, name, hex_code FROM Color ORDER BY name")
     colors = [{'id': row[0], 'name': row[1], 'hex_code': row[2]} for row in result]
     session.close()
     return jsonify(colors)
 
-@app.route('/api/subjects', methods=['GET'])
+@api.route('/api/subjects', methods=['GET'])
 def get_subjects():
-    session = Session()
-    result = session.execute(text("SELECT id, name FROM SubjectMatter ORDER BY name"))
+    session = read_session()
+    result = execute(session, "SELECT id, name FROM SubjectMatter ORDER BY name")
     subjects = [{'id': row[0], 'name': row[1]} for row in result]
     session.close()
     return jsonify(subjects)
 
-@app.route('/api/months', methods=['GET'])
+@api.route('/api/months', methods=['GET'])
 def get_months():
     months = [
         {'id': 1, 'name': 'January'},
@@ -178,10 +227,10 @@ def get_months():
     ]
     return jsonify(months)
 
-@app.route('/api/episodes/<int:season>/<int:episode>', methods=['GET'])
+@api.route('/api/episodes/<int:season>/<int:episode>', methods=['GET'])
 def get_episode_details(season, episode):
-    session = Session()
-    query = text("""
+    session = read_session()
+    query = """
     SELECT e.id, e.title, e.season_number, e.episode_number, e.air_date, e.youtube_url, e.image_url,
            ARRAY_AGG(DISTINCT c.name) FILTER (WHERE c.name IS NOT NULL) as colors,
            ARRAY_AGG(DISTINCT s.name) FILTER (WHERE s.name IS NOT NULL) as subjects
@@ -192,8 +241,8 @@ def get_episode_details(season, episode):
     LEFT JOIN SubjectMatter s ON es.subject_id = s.id
     WHERE e.season_number = :season AND e.episode_number = :episode
     GROUP BY e.id, e.title, e.season_number, e.episode_number, e.air_date, e.youtube_url, e.image_url
-    """)
-    result = session.execute(query, {"season": season, "episode": episode}).fetchone()
+    """
+    result = execute(session, query, {"season": season, "episode": episode}).fetchone()
     if not result:
         session.close()
         return jsonify({"error": "Episode not found"}), 404
@@ -211,5 +260,98 @@ def get_episode_details(season, episode):
     session.close()
     return jsonify(episode_data)
 
+# --- STATS ---
+TERM_TYPES = ('color', 'subject')
+PERIOD_TYPES = ('season', 'year', 'month')
+MAX_STATS_LIMIT = 100
+
+def get_stats_limit():
+    """Parse ?limit= (default 10), capped at MAX_STATS_LIMIT; None if it is not a positive integer."""
+    if 'limit' not in request.args:
+        return 10
+    # type=int gives None for anything int() rejects
+    limit = request.args.get('limit', type=int)
+    if limit is None or limit < 1:
+        return None
+    return min(limit, MAX_STATS_LIMIT)
+
+@api.route('/api/stats/top', methods=['GET'])
+def get_top_terms():
+    term_type = request.args.get('term_type', 'color')
+    period_type = request.args.get('period_type', 'season')
+    period = request.args.get('period', type=int)
+    limit = get_stats_limit()
+    if term_type not in TERM_TYPES or period_type not in PERIOD_TYPES or period is None:
+        return jsonify({"error": "term_type must be color or subject, period_type must be season, year or month, and period is required"}), 400
+    if limit is None:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    session = read_session()
+    query = """
+    SELECT term, usage_count, episode_count, share
+    FROM TermUsageRollup
+    WHERE period_type = :period_type AND period = :period AND term_type = :term_type
+    ORDER BY usage_count DESC, term
+    LIMIT :limit
+    """
+    result = execute(session, query, {"term_type": term_type, "period_type": period_type, "period": period, "limit": limit})
+    terms = [{'term': row[0], 'usage_count': row[1], 'episode_count': row[2], 'share': row[3]} for row in result]
+    session.close()
+    return jsonify(terms)
+
+@api.route('/api/stats/series', methods=['GET'])
+def get_term_series():
+    term_type = request.args.get('term_type', 'color')
+    term = request.args.get('term')
+    period_type = request.args.get('period_type', 'season')
+    if term_type not in TERM_TYPES or period_type not in PERIOD_TYPES or not term:
+        return jsonify({"error": "term_type must be color or subject, period_type must be season, year or month, and term is required"}), 400
+
+    session = read_session()
+    query = """
+    SELECT period, usage_count, episode_count, share
+    FROM TermUsageRollup
+    WHERE term_type = :term_type AND term = :term AND period_type = :period_type
+    ORDER BY period
+    """
+    result = execute(session, query, {"term_type": term_type, "term": term, "period_type": period_type})
+    series = [{'period': row[0], 'usage_count': row[1], 'episode_count': row[2], 'share': row[3]} for row in result]
+    session.close()
+    return jsonify(series)
+
+@api.route('/api/stats/cooccurrence', methods=['GET'])
+def get_cooccurrence():
+    term_type = request.args.get('term_type', 'color')
+    with_type = request.args.get('with', 'subject')
+    term = request.args.get('term')
+    limit = get_stats_limit()
+    if term_type not in TERM_TYPES or with_type not in TERM_TYPES:
+        return jsonify({"error": "term_type and with must be color or subject"}), 400
+    if limit is None:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    session = read_session()
+    params = {"term_type": term_type, "with_type": with_type, "limit": limit}
+    if term:
+        # Terms most often seen with one term
+        where = "term_type_a = :term_type AND term_a = :term AND term_type_b = :with_type"
+        params["term"] = term
+    elif term_type == with_type:
+        # Pairs are stored in both directions, keep one of each
+        where = "term_type_a = :term_type AND term_type_b = :with_type AND term_a < term_b"
+    else:
+        where = "term_type_a = :term_type AND term_type_b = :with_type"
+    query = f"""
+    SELECT term_a, term_b, episode_count
+    FROM TermCooccurrence
+    WHERE {where}
+    ORDER BY episode_count DESC, term_a, term_b
+    LIMIT :limit
+    """
+    result = execute(session, query, params)
+    pairs = [{'term': row[0], 'with': row[1], 'episode_count': row[2]} for row in result]
+    session.close()
+    return jsonify(pairs)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
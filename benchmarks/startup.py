@@ -0,0 +1,85 @@
+"""
+Measure API and ETL startup time in fresh interpreters.
+
+    python benchmarks/startup.py [--runs 5] [--with-db]
+
+Reports import time of api/app.py and etl/etl_pipeline.py, create_app() time and
+the time of the first request. --with-db also times a first request that queries
+the database (needs a reachable PostgreSQL).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+API_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from api.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+client.get('/api/months')
+first_request = time.perf_counter()
+timings = {{
+    'api import': imported - start,
+    'api create_app': created - imported,
+    'api first request': first_request - created,
+}}
+if {with_db!r}:
+    client.get('/api/colors')
+    timings['api first db request'] = time.perf_counter() - first_request
+timings['pandas loaded by api'] = float('pandas' in sys.modules)
+print(json.dumps(timings))
+"""
+
+ETL_PROBE = """
+import json, sys, time
+sys.path.insert(0, {etl!r})
+start = time.perf_counter()
+import etl_pipeline
+print(json.dumps({{
+    'etl import': time.perf_counter() - start,
+    'pandas loaded by etl import': float('pandas' in sys.modules),
+}}))
+"""
+
+
+def run_probe(code):
+    """Run a probe in a fresh interpreter and return its timings."""
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--with-db', action='store_true', help='also time a first request that hits the database')
+    args = parser.parse_args()
+
+    api_probe = API_PROBE.format(root=os.path.abspath(ROOT), with_db=args.with_db)
+    etl_probe = ETL_PROBE.format(etl=os.path.abspath(os.path.join(ROOT, 'etl')))
+
+    samples = {}
+    for _ in range(args.runs):
+        for probe in (api_probe, etl_probe):
+            for name, value in run_probe(probe).items():
+                samples.setdefault(name, []).append(value)
+
+    print(f"{'measurement':<30}{'min (ms)':>12}{'median (ms)':>14}")
+    for name, values in samples.items():
+        if name.startswith('pandas loaded'):
+            print(f"{name:<30}{'yes' if any(values) else 'no':>12}")
+            continue
+        print(f"{name:<30}{min(values) * 1000:>12.1f}{statistics.median(values) * 1000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
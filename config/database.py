@@ -0,0 +1,302 @@
+import itertools
+import os
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from config import setting
+
+HEALTH_QUERY = text("SELECT 1")
+GENERATION_QUERY = text("SELECT generation FROM DatasetGeneration")
+BUMP_GENERATION_QUERY = text("""
+    UPDATE DatasetGeneration
+    SET generation = generation + 1, updated_at = now()
+    RETURNING generation
+""")
+
+
+class Replica:
+    """A read replica with its own connection pool and cached health/generation."""
+
+    def __init__(self, url, **engine_kwargs):
+        self.url = url
+        self.engine_kwargs = engine_kwargs
+        self._engine = None
+        self._session_factory = None
+        self._engine_lock = threading.Lock()
+        # Unknown until the first check
+        self.healthy = False
+        self.generation = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _init_engine(self):
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = create_engine(self.url, pool_pre_ping=True, **self.engine_kwargs)
+                self._session_factory = sessionmaker(bind=self._engine)
+
+    @property
+    def engine(self):
+        """The replica's engine, created on first use."""
+        self._init_engine()
+        return self._engine
+
+    def Session(self):
+        self._init_engine()
+        return self._session_factory()
+
+    @property
+    def load(self):
+        """Number of connections currently checked out of the pool."""
+        if self._engine is None:
+            return 0
+        return self._engine.pool.checkedout()
+
+    def check(self):
+        """Ping the replica and refresh its dataset generation."""
+        # Skip if another thread is already checking this replica
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(HEALTH_QUERY)
+                self.healthy = True
+                try:
+                    self.generation = conn.execute(GENERATION_QUERY).scalar()
+                except SQLAlchemyError:
+                    self.generation = None
+        except SQLAlchemyError as e:
+            print(f"Replica {self.engine.url!r} failed health check: {e}")
+            self.healthy = False
+        finally:
+            self.checked_at = time.monotonic()
+            self._lock.release()
+
+
+class DatabaseRouter:
+    """
+    Route writes to the primary and reads to the least-loaded healthy replica.
+    Falls back to the primary when no replica is configured, healthy or fresh enough.
+
+    Replicas are checked once on the first read, then refreshed by a background
+    thread every health_check_interval seconds; request threads only re-check a
+    lagging replica, at most once per lag_recheck_interval seconds.
+    """
+
+    def __init__(self, primary_url, replica_urls=(), health_check_interval=30, read_your_writes=False,
+                 lag_recheck_interval=1, **engine_kwargs):
+        self.primary_url = primary_url
+        self.engine_kwargs = engine_kwargs
+        self._primary = None
+        self._primary_session_factory = None
+        self._engine_lock = threading.Lock()
+        self._pid = os.getpid()
+        self.replicas = [Replica(url, **engine_kwargs) for url in replica_urls]
+        self.health_check_interval = health_check_interval
+        self.lag_recheck_interval = lag_recheck_interval
+        self.read_your_writes = read_your_writes
+        self.last_generation = None
+        self.primary_generation = None
+        self.primary_generation_at = 0.0
+        self._rotation = itertools.count()
+        self._monitor = None
+        self._monitor_pid = None
+        self._monitor_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _init_primary(self):
+        self._reset_after_fork()
+        with self._engine_lock:
+            if self._primary is None:
+                self._primary = create_engine(self.primary_url, pool_pre_ping=True, **self.engine_kwargs)
+                self._primary_session_factory = sessionmaker(bind=self._primary)
+
+    @property
+    def primary(self):
+        """The primary's engine, created on first use."""
+        self._init_primary()
+        return self._primary
+
+    def PrimarySession(self):
+        self._init_primary()
+        return self._primary_session_factory()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            setting.DB_PRIMARY_URL,
+            setting.DB_REPLICA_URLS,
+            health_check_interval=setting.DB_HEALTH_CHECK_INTERVAL,
+            read_your_writes=setting.DB_READ_YOUR_WRITES,
+            lag_recheck_interval=setting.DB_LAG_RECHECK_INTERVAL,
+        )
+
+    def _reset_after_fork(self):
+        """
+        Drop pooled connections inherited from the parent process (e.g. opened by
+        warm-up under gunicorn --preload), so a worker never shares their sockets.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._engine_lock:
+            if self._pid == os.getpid():
+                return
+            for engine in [self._primary] + [replica._engine for replica in self.replicas]:
+                if engine is not None:
+                    # close=False leaves the parent's connections open for the parent
+                    engine.dispose(close=False)
+            self._pid = os.getpid()
+
+    # -- Background health checks --
+    def _ensure_monitor(self):
+        """Start the health check thread in this process if it is not running (e.g. after a fork)."""
+        if self._monitor_pid == os.getpid() and self._monitor.is_alive():
+            return
+        with self._monitor_lock:
+            if self._monitor_pid == os.getpid() and self._monitor.is_alive():
+                return
+            self._stop = threading.Event()
+            self._monitor = threading.Thread(target=self._monitor_loop, args=(self._stop,),
+                                             name='replica-health-check', daemon=True)
+            self._monitor_pid = os.getpid()
+            self._monitor.start()
+
+    def _monitor_loop(self, stop):
+        while not stop.is_set():
+            self.check_replicas()
+            stop.wait(self.health_check_interval)
+
+    def stop_monitor(self):
+        """Stop the background health check thread."""
+        self._stop.set()
+
+    def check_replicas(self):
+        """Refresh every replica's health and, for read-your-writes, the primary's generation."""
+        for replica in self.replicas:
+            replica.check()
+        if self.read_your_writes:
+            self.refresh_primary_generation()
+
+    def refresh_primary_generation(self):
+        """Read the current dataset generation from the primary."""
+        try:
+            with self.primary.connect() as conn:
+                self.primary_generation = conn.execute(GENERATION_QUERY).scalar()
+        except SQLAlchemyError as e:
+            print(f"Could not read dataset generation from the primary: {e}")
+        finally:
+            self.primary_generation_at = time.monotonic()
+        return self.primary_generation
+
+    def required_generation(self):
+        """
+        Minimum replica generation for read-your-writes: the primary's generation
+        (re-read at most once per lag_recheck_interval) or the last load made by this process.
+        """
+        if time.monotonic() - self.primary_generation_at >= self.lag_recheck_interval:
+            self.refresh_primary_generation()
+        known = [g for g in (self.primary_generation, self.last_generation) if g is not None]
+        return max(known) if known else None
+
+    def pick_replica(self, min_generation=None):
+        """Return the least-loaded healthy replica at or past min_generation, or None."""
+        if not self.replicas:
+            return None
+        self._reset_after_fork()
+        # Never route to a replica nobody has checked yet
+        for replica in self.replicas:
+            if not replica.checked_at:
+                replica.check()
+        self._ensure_monitor()
+
+        candidates = [r for r in self.replicas if r.healthy]
+        if min_generation is not None:
+            # A lagging replica may have caught up since its last check
+            now = time.monotonic()
+            for replica in candidates:
+                if ((replica.generation is None or replica.generation < min_generation)
+                        and now - replica.checked_at >= self.lag_recheck_interval):
+                    replica.check()
+            candidates = [r for r in candidates
+                          if r.healthy and r.generation is not None and r.generation >= min_generation]
+        if not candidates:
+            return None
+
+        # Rotate the starting point so idle replicas share ties
+        offset = next(self._rotation) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda r: r.load)
+
+    def read_session(self, min_generation=None):
+        """Open a session for read-only queries."""
+        if not self.replicas:
+            return self.PrimarySession()
+        if self.read_your_writes:
+            required = self.required_generation()
+            if required is not None:
+                min_generation = max(min_generation or 0, required)
+        replica = self.pick_replica(min_generation)
+        if replica is None:
+            return self.PrimarySession()
+        session = replica.Session()
+        try:
+            # Connect now, so a replica that died since its last check falls back here
+            session.connection()
+        except SQLAlchemyError as e:
+            session.close()
+            print(f"Replica {replica.engine.url!r} is unreachable, reading from the primary: {e}")
+            replica.healthy = False
+            return self.PrimarySession()
+        return session
+
+    def write_session(self):
+        """Open a session on the primary."""
+        return self.PrimarySession()
+
+    def bump_generation(self, session):
+        """
+        Advance the dataset generation inside the caller's write transaction.
+        Returns the new generation, or None if the DatasetGeneration table is missing.
+        """
+        try:
+            # Savepoint, so a missing table does not abort the load itself
+            with session.begin_nested():
+                generation = session.execute(BUMP_GENERATION_QUERY).scalar()
+        except SQLAlchemyError as e:
+            print(f"Could not bump dataset generation: {e}")
+            return None
+        self.last_generation = generation
+        return generation
+
+    def warm_up(self, connections=1):
+        """
+        Open `connections` pooled connections on the primary and every replica and
+        refresh replica health, so the first requests do not pay for connecting.
+        """
+        for engine in [self.primary] + [replica.engine for replica in self.replicas]:
+            opened = []
+            try:
+                for _ in range(connections):
+                    conn = engine.connect()
+                    opened.append(conn)
+                    conn.execute(HEALTH_QUERY)
+            except SQLAlchemyError as e:
+                print(f"Could not warm up {engine.url!r}: {e}")
+            finally:
+                for conn in opened:
+                    conn.close()
+        self.check_replicas()
+
+
+_router = None
+
+
+def get_router():
+    """Return the process-wide router built from settings, creating it on first use."""
+    global _router
+    if _router is None:
+        _router = DatabaseRouter.from_settings()
+    return _router
@@ -1,4 +1,5 @@
 import os
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -10,3 +11,15 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '5432')
 DB_NAME = os.getenv('DB_NAME', 'joy_of_painting')
+
+# Read/write routing: writes always go to the primary, reads go to the
+# least-loaded healthy replica (or the primary when no replicas are configured)
+DB_PRIMARY_URL = os.getenv('DB_PRIMARY_URL') or f"postgresql://{DB_USER}:{quote_plus(DB_PASSWORD)}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DB_REPLICA_URLS = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '30'))
+DB_LAG_RECHECK_INTERVAL = float(os.getenv('DB_LAG_RECHECK_INTERVAL', '1'))
+DB_READ_YOUR_WRITES = os.getenv('DB_READ_YOUR_WRITES', 'false').lower() in ('1', 'true', 'yes')
+
+# API startup: optionally open pooled connections and prime lookups before serving
+API_WARM_UP = os.getenv('API_WARM_UP', 'false').lower() in ('1', 'true', 'yes')
+API_WARM_UP_CONNECTIONS = int(os.getenv('API_WARM_UP_CONNECTIONS', '1'))
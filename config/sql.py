@@ -0,0 +1,8 @@
+def execute(session, query, params=None):
+    """
+    Execute a raw SQL string on a session.
+    SQLAlchemy is imported here rather than at module level, so modules that use
+    this helper stay cheap to import until they actually query the database.
+    """
+    from sqlalchemy import text
+    return session.execute(text(query), params or {})
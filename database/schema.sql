@@ -46,3 +46,41 @@ CREATE TABLE EpisodeSubject (
     FOREIGN KEY (episode_id) REFERENCES Episode(id) ON DELETE CASCADE,
     FOREIGN KEY (subject_id) REFERENCES SubjectMatter(id) ON DELETE CASCADE
 );
+
+-- Create DatasetGeneration table (single row, bumped by every ETL load;
+-- replicas report it so reads can wait for a given load to replicate)
+CREATE TABLE DatasetGeneration (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+INSERT INTO DatasetGeneration DEFAULT VALUES;
+
+-- Create TermUsageRollup table (usage count and share of each color/subject
+-- per season, air-date year and air-date month; rebuilt by every ETL load)
+CREATE TABLE TermUsageRollup (
+    term_type VARCHAR(16) NOT NULL,
+    term VARCHAR(255) NOT NULL,
+    period_type VARCHAR(16) NOT NULL,
+    period INTEGER NOT NULL,
+    usage_count INTEGER NOT NULL,
+    episode_count INTEGER NOT NULL,
+    share DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (term_type, term, period_type, period)
+);
+
+CREATE INDEX idx_term_usage_top ON TermUsageRollup (period_type, period, term_type, usage_count DESC);
+
+-- Create TermCooccurrence table (episodes in which two terms appear together,
+-- stored in both directions; rebuilt by every ETL load)
+CREATE TABLE TermCooccurrence (
+    term_type_a VARCHAR(16) NOT NULL,
+    term_a VARCHAR(255) NOT NULL,
+    term_type_b VARCHAR(16) NOT NULL,
+    term_b VARCHAR(255) NOT NULL,
+    episode_count INTEGER NOT NULL,
+    PRIMARY KEY (term_type_a, term_a, term_type_b, term_b)
+);
+
+CREATE INDEX idx_term_cooccurrence_top ON TermCooccurrence (term_type_a, term_type_b, episode_count DESC);
@@ -1,27 +1,17 @@
-import pandas as pd
 import re
 from datetime import datetime
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from urllib.parse import quote_plus
 import os
+import sys
 
-# Database connection configuration
-DB_USER = os.getenv('DB_USER', 'postgres')
-DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_PORT = os.getenv('DB_PORT', '5432')
-DB_NAME = os.getenv('DB_NAME', 'joy_of_painting')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.sql import execute
 
-# Create connection string
-password = quote_plus(DB_PASSWORD)
-connection_string = f"postgresql://{DB_USER}:{password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(connection_string)
-Session = sessionmaker(bind=engine)
-session = Session()
+# pandas and the reconcile/rollups stages are imported inside the functions that
+# need them, and SQLAlchemy on the first query, so importing this module stays cheap
 
 def extract_episode_dates():
     """Extract episode data from the dates CSV file."""
+    import pandas as pd
     with open('data/The Joy Of Painting - Episode Dates.csv', 'r') as f:
         lines = f.readlines()
     
@@ -49,6 +39,7 @@ def extract_episode_dates():
 
 def extract_color_data():
     """Extract color data from the colors CSV file."""
+    import pandas as pd
     df = pd.read_csv('data/The Joy Of Painiting - Colors Used.csv', on_bad_lines='skip')
     
     # Clean column names
@@ -59,6 +50,7 @@ def extract_color_data():
 
 def extract_subject_data():
     """Extract subject matter data from the subject CSV file."""
+    import pandas as pd
     df = pd.read_csv('data/The Joy Of Painiting - Subject Matter.csv', on_bad_lines='skip')
     
     # Clean column names
@@ -68,25 +60,29 @@ def extract_subject_data():
 
 def transform_data(episodes_df, colors_df, subjects_df):
     """Transform data to match database schema."""
-    # Add air_date to colors_df
-    for idx, row in colors_df.iterrows():
-        title = row['painting_title']
-        match = episodes_df[episodes_df['title'] == title.strip()]
-        if len(match) > 0:
-            colors_df.at[idx, 'air_date'] = match.iloc[0]['air_date']
+    from reconcile import build_episode_keys
     
-    # Extract season and episode numbers from EPISODE column in subjects_df
-    subjects_df['season_number'] = subjects_df['EPISODE'].str.extract(r'S(\d+)E\d+').astype(int)
-    subjects_df['episode_number'] = subjects_df['EPISODE'].str.extract(r'S\d+E(\d+)').astype(int)
+    # Reconcile the sources into the canonical episode key table
+    episode_keys = build_episode_keys(colors_df, subjects_df, episodes_df)
+
+    # Add air_date to colors_df
+    colors_df['air_date'] = episode_keys.dropna(subset=['colors_row']).set_index('colors_row')['air_date'].reindex(colors_df.index)
     
-    return colors_df, subjects_df
+    return episode_keys, colors_df, subjects_df
 
 def clean_column_name(name):
     """Clean column names to match database field names."""
     return name.replace(' ', '_').replace('-', '_').replace('\r', '').replace('\n', '').lower()
 
-def load_data_to_db(episodes_df, colors_df, subjects_df):
+def load_data_to_db(episode_keys, colors_df, subjects_df):
     """Load transformed data into the database."""
+    import pandas as pd
+    from config.database import get_router
+    from rollups import build_rollups, write_rollups
+    
+    # Loads always write to the primary
+    router = get_router()
+    session = router.write_session()
     
     # First, populate the Color table
     color_columns = [col for col in colors_df.columns 
@@ -118,14 +114,14 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
         clean_hex = hex_code.strip()
         
         # Insert or get color ID
-        query = text("""
+        query = """
             INSERT INTO Color (name, hex_code) 
             VALUES (:name, :hex_code) 
             ON CONFLICT (name) DO UPDATE SET hex_code = :hex_code 
             RETURNING id
-        """)
+        """
         try:
-            result = session.execute(query, {"name": clean_name, "hex_code": clean_hex})
+            result = execute(session, query, {"name": clean_name, "hex_code": clean_hex})
             color_id = result.fetchone()[0]
             color_ids[clean_name] = color_id
         except Exception as e:
@@ -135,27 +131,31 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
     
     # Insert episodes
     episode_ids = {}
-    for idx, row in colors_df.iterrows():
-        title = row['painting_title'].strip()
-        season_num = int(row['season'])
-        episode_num = int(row['episode'])
-        air_date = row['air_date'] if 'air_date' in row else None
-        youtube_url = row['youtube_src'] if 'youtube_src' in row else None
-        image_url = row['img_src'] if 'img_src' in row else None
+    for row in episode_keys.itertuples(index=False):
+        if pd.isna(row.air_date):
+            print(f"Skipping episode (no air date): {row.episode_key} {row.title}")
+            continue
+        
+        title = row.title
+        season_num = int(row.season_number)
+        episode_num = int(row.episode_number)
+        air_date = row.air_date
+        youtube_url = row.youtube_url
+        image_url = row.image_url
         
         # Insert episode
-        query = text("""
+        query = """
             INSERT INTO Episode (title, season_number, episode_number, air_date, youtube_url, image_url)
             VALUES (:title, :season_number, :episode_number, :air_date, :youtube_url, :image_url)
             ON CONFLICT (season_number, episode_number) DO UPDATE SET
                 title = :title,
-                air_date = COALESCE(:air_date, air_date),
-                youtube_url = COALESCE(:youtube_url, youtube_url),
-                image_url = COALESCE(:image_url, image_url)
+                air_date = COALESCE(:air_date, Episode.air_date),
+                youtube_url = COALESCE(:youtube_url, Episode.youtube_url),
+                image_url = COALESCE(:image_url, Episode.image_url)
             RETURNING id
-        """)
+        """
         try:
-            result = session.execute(query, {
+            result = execute(session, query, {
                 "title": title,
                 "season_number": season_num,
                 "episode_number": episode_num,
@@ -164,21 +164,22 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
                 "image_url": image_url
             })
             episode_id = result.fetchone()[0]
-            episode_ids[(season_num, episode_num)] = episode_id
+            episode_ids[row.episode_key] = episode_id
         except Exception as e:
             print(f"Error inserting episode {title} (S{season_num}E{episode_num}): {e}")
     
     session.commit()
     
+    # Map source rows to episodes through the key table
+    colors_keys = dict(zip(episode_keys['colors_row'], episode_keys['episode_key']))
+    subjects_keys = dict(zip(episode_keys['subjects_row'], episode_keys['episode_key']))
+    
     # Insert episode colors
     for idx, row in colors_df.iterrows():
-        season_num = int(row['season'])
-        episode_num = int(row['episode'])
-        
-        if (season_num, episode_num) not in episode_ids:
+        if colors_keys.get(idx) not in episode_ids:
             continue
             
-        episode_id = episode_ids[(season_num, episode_num)]
+        episode_id = episode_ids[colors_keys[idx]]
         
         # Get colors used in this episode
         for color_name, is_used in row.items():
@@ -189,37 +190,37 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
                 if matching_colors:
                     color_id = color_ids[matching_colors[0]]
                     # Insert into EpisodeColor
-                    query = text("""
+                    query = """
                         INSERT INTO EpisodeColor (episode_id, color_id, is_used)
                         VALUES (:episode_id, :color_id, true)
                         ON CONFLICT (episode_id, color_id) DO NOTHING
-                    """)
-                    session.execute(query, {"episode_id": episode_id, "color_id": color_id})
+                    """
+                    execute(session, query, {"episode_id": episode_id, "color_id": color_id})
     
     session.commit()
     
     # Insert subject matter data
-    subject_columns = [col for col in subjects_df.columns if col not in ['EPISODE', 'TITLE', 'season_number', 'episode_number']]
+    subject_columns = [col for col in subjects_df.columns if col not in ['EPISODE', 'TITLE']]
     
     # First, populate SubjectMatter table
     subject_ids = {}
     for subject_name in subject_columns:
         clean_name = subject_name.replace('_', ' ').title()
-        query = text("""
+        query = """
             INSERT INTO SubjectMatter (name)
             VALUES (:name)
             ON CONFLICT (name) DO NOTHING
             RETURNING id
-        """)
+        """
         try:
-            result = session.execute(query, {"name": clean_name})
+            result = execute(session, query, {"name": clean_name})
             if result.rowcount > 0:
                 subject_id = result.fetchone()[0]
                 subject_ids[clean_name] = subject_id
             else:
                 # Get the ID if it already existed
-                query = text("SELECT id FROM SubjectMatter WHERE name = :name")
-                result = session.execute(query, {"name": clean_name})
+                query = "SELECT id FROM SubjectMatter WHERE name = :name"
+                result = execute(session, query, {"name": clean_name})
                 if result.rowcount > 0:
                     subject_id = result.fetchone()[0]
                     subject_ids[clean_name] = subject_id
@@ -230,12 +231,9 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
     
     # Insert episode subjects
     for idx, row in subjects_df.iterrows():
-        season_num = row['season_number']
-        episode_num = row['episode_number']
-        
         # Find episode ID
-        if (season_num, episode_num) in episode_ids:
-            episode_id = episode_ids[(season_num, episode_num)]
+        if subjects_keys.get(idx) in episode_ids:
+            episode_id = episode_ids[subjects_keys[idx]]
         else:
             continue
             
@@ -245,15 +243,21 @@ def load_data_to_db(episodes_df, colors_df, subjects_df):
                 clean_name = subject_name.replace('_', ' ').title()
                 if clean_name in subject_ids:
                     subject_id = subject_ids[clean_name]
-                    query = text("""
+                    query = """
                         INSERT INTO EpisodeSubject (episode_id, subject_id, is_featured)
                         VALUES (:episode_id, :subject_id, true)
                         ON CONFLICT (episode_id, subject_id) DO NOTHING
-                    """)
-                    session.execute(query, {"episode_id": episode_id, "subject_id": subject_id})
+                    """
+                    execute(session, query, {"episode_id": episode_id, "subject_id": subject_id})
+    
+    # Rebuild the analytics rollups
+    usage, cooccurrence = build_rollups(episode_keys, colors_df, subjects_df)
+    write_rollups(session, usage, cooccurrence)
     
+    generation = router.bump_generation(session)
     session.commit()
     session.close()
+    return generation
 
 def main():
     print("Starting ETL process...")
@@ -266,11 +270,13 @@ def main():
     
     # Transform data
     print("Transforming data...")
-    colors_df, subjects_df = transform_data(episodes_df, colors_df, subjects_df)
+    episode_keys, colors_df, subjects_df = transform_data(episodes_df, colors_df, subjects_df)
     
     # Load data to database
     print("Loading data to database...")
-    load_data_to_db(episodes_df, colors_df, subjects_df)
+    generation = load_data_to_db(episode_keys, colors_df, subjects_df)
+    if generation is not None:
+        print(f"Dataset generation is now {generation}.")
     
     print("ETL process completed successfully!")
 
@@ -0,0 +1,204 @@
+import re
+from collections import defaultdict, deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Minimum trigram cosine similarity for a fuzzy title match to be accepted
+FUZZY_THRESHOLD = 0.5
+
+# Columns of the canonical episode key table
+KEY_COLUMNS = [
+    'episode_key', 'season_number', 'episode_number', 'title', 'air_date',
+    'youtube_url', 'image_url', 'colors_row', 'subjects_row', 'dates_row', 'match_method',
+]
+
+# Spelling variants that the sources disagree on
+TITLE_REPLACEMENTS = [
+    (r'&', ' and '),
+    (r'\bmt\b\.?', 'mount'),
+    (r'\bgrey\b', 'gray'),
+    (r"['’]", ''),
+    (r'[^a-z0-9]+', ' '),
+    (r'^(?:a|an|the|to) ', ''),
+    (r'\s+', ' '),
+]
+
+
+def normalize_titles(titles):
+    """Normalize a Series of titles so the same episode hashes identically across sources."""
+    normalized = titles.fillna('').astype(str).str.strip().str.strip('"').str.lower()
+    for pattern, replacement in TITLE_REPLACEMENTS:
+        normalized = normalized.str.replace(pattern, replacement, regex=True)
+    return normalized.str.strip()
+
+
+def episode_key(season, episode):
+    """Build the canonical SxxEyy key for a season/episode pair."""
+    return f"S{int(season):02d}E{int(episode):02d}"
+
+
+# -- Source readers --
+def read_episode_dates(path):
+    """Read the free-text dates file into a DataFrame with title and air_date columns."""
+    episodes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = re.match(r'"?(.*?)"?\s*\((.*?)\)', line.strip())
+            if not match:
+                continue
+            try:
+                air_date = datetime.strptime(match.group(2).strip(), "%B %d, %Y").date()
+            except ValueError:
+                air_date = None
+            episodes.append({'title': match.group(1).strip(), 'air_date': air_date})
+    return pd.DataFrame(episodes, columns=['title', 'air_date'])
+
+
+def read_colors(path):
+    """Read the colors CSV."""
+    return pd.read_csv(path, on_bad_lines='skip')
+
+
+def read_subjects(path):
+    """Read the subject matter CSV."""
+    return pd.read_csv(path, on_bad_lines='skip')
+
+
+# -- Fuzzy fallback --
+def _trigram_matrix(titles, vocabulary):
+    """Build an L2-normalized trigram count matrix for the given titles."""
+    matrix = np.zeros((len(titles), len(vocabulary)))
+    for i, title in enumerate(titles):
+        padded = f"  {title} "
+        for j in range(len(padded) - 2):
+            matrix[i, vocabulary[padded[j:j + 3]]] += 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def fuzzy_match(left_titles, right_titles, threshold=FUZZY_THRESHOLD):
+    """
+    Match two lists of normalized titles one-to-one by trigram cosine similarity.
+    Returns a list of (left_index, right_index, score) tuples.
+    """
+    if not left_titles or not right_titles:
+        return []
+
+    vocabulary = {}
+    for title in list(left_titles) + list(right_titles):
+        padded = f"  {title} "
+        for j in range(len(padded) - 2):
+            vocabulary.setdefault(padded[j:j + 3], len(vocabulary))
+
+    scores = _trigram_matrix(left_titles, vocabulary) @ _trigram_matrix(right_titles, vocabulary).T
+
+    # Greedy assignment, best scoring pairs first
+    matches = []
+    used_left, used_right = set(), set()
+    order = np.argsort(-scores, axis=None, kind='stable')
+    for flat in order:
+        i, j = np.unravel_index(flat, scores.shape)
+        score = scores[i, j]
+        if score < threshold:
+            break
+        if i in used_left or j in used_right:
+            continue
+        used_left.add(i)
+        used_right.add(j)
+        matches.append((int(i), int(j), float(score)))
+    return matches
+
+
+# -- Reconciliation --
+def build_episode_keys(colors_df, subjects_df, dates_df):
+    """
+    Reconcile the three sources into one canonical episode key table.
+
+    Colors and subjects are joined on (season, episode); the dates file only has
+    titles, so it is joined on normalized title, with a fuzzy fallback for leftovers.
+    """
+    subject_codes = subjects_df['EPISODE'].astype(str).str.extract(r'S(\d+)E(\d+)')
+
+    # One pass over all sources to build both hash indexes
+    sources = pd.concat([
+        pd.DataFrame({
+            'source': 'colors',
+            'row': colors_df.index,
+            'season': pd.to_numeric(colors_df['season'], errors='coerce'),
+            'episode': pd.to_numeric(colors_df['episode'], errors='coerce'),
+            'title': colors_df['painting_title'],
+        }),
+        pd.DataFrame({
+            'source': 'subjects',
+            'row': subjects_df.index,
+            'season': pd.to_numeric(subject_codes[0], errors='coerce'),
+            'episode': pd.to_numeric(subject_codes[1], errors='coerce'),
+            'title': subjects_df['TITLE'],
+        }),
+        pd.DataFrame({
+            'source': 'dates',
+            'row': dates_df.index,
+            'season': np.nan,
+            'episode': np.nan,
+            'title': dates_df['title'],
+        }),
+    ], ignore_index=True)
+    sources['norm_title'] = normalize_titles(sources['title'])
+
+    by_code = defaultdict(dict)
+    by_title = defaultdict(lambda: defaultdict(deque))
+    for source, row, season, episode, norm_title in sources[
+            ['source', 'row', 'season', 'episode', 'norm_title']].itertuples(index=False):
+        if pd.notna(season) and pd.notna(episode):
+            by_code[(int(season), int(episode))].setdefault(source, (row, norm_title))
+        by_title[source][norm_title].append(row)
+
+    # Exact joins: (season, episode) across colors/subjects, normalized title into dates
+    keys = []
+    for season, episode in sorted(by_code):
+        matched = by_code[(season, episode)]
+        rows = {source: row for source, (row, _) in matched.items()}
+        titles = [matched[source][1] for source in ('colors', 'subjects') if source in matched]
+        dates_row = None
+        for norm_title in titles:
+            candidates = by_title['dates'].get(norm_title)
+            if candidates:
+                dates_row = candidates.popleft()
+                break
+        keys.append({
+            'season_number': season,
+            'episode_number': episode,
+            'colors_row': rows.get('colors'),
+            'subjects_row': rows.get('subjects'),
+            'dates_row': dates_row,
+            'norm_title': titles[0] if titles else '',
+            'match_method': 'exact' if dates_row is not None else None,
+        })
+
+    # Fuzzy fallback, only for episodes the hash indexes could not place
+    leftover_keys = [k for k in keys if k['dates_row'] is None]
+    leftover_dates = [(row, norm_title) for norm_title, rows in by_title['dates'].items() for row in rows]
+    for i, j, _ in fuzzy_match([k['norm_title'] for k in leftover_keys],
+                               [norm_title for _, norm_title in leftover_dates]):
+        leftover_keys[i]['dates_row'] = leftover_dates[j][0]
+        leftover_keys[i]['match_method'] = 'fuzzy'
+
+    # Resolve display fields from the best source for each
+    for key in keys:
+        colors_row, subjects_row, dates_row = key['colors_row'], key['subjects_row'], key['dates_row']
+        if colors_row is not None:
+            title = str(colors_df.at[colors_row, 'painting_title']).strip()
+        elif dates_row is not None:
+            title = str(dates_df.at[dates_row, 'title']).strip()
+        else:
+            title = str(subjects_df.at[subjects_row, 'TITLE']).strip('"').title()
+        key['episode_key'] = episode_key(key['season_number'], key['episode_number'])
+        key['title'] = title
+        key['air_date'] = dates_df.at[dates_row, 'air_date'] if dates_row is not None else None
+        key['youtube_url'] = colors_df.at[colors_row, 'youtube_src'] if colors_row is not None else None
+        key['image_url'] = colors_df.at[colors_row, 'img_src'] if colors_row is not None else None
+
+    return pd.DataFrame(keys, columns=KEY_COLUMNS)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from config.sql import execute
+
+# Non one-hot columns of the source CSVs
+COLOR_METADATA_COLUMNS = ['painting_index', 'img_src', 'painting_title', 'season', 'episode',
+                          'num_colors', 'youtube_src', 'colors', 'color_hex', 'air_date']
+SUBJECT_METADATA_COLUMNS = ['EPISODE', 'TITLE']
+
+PERIOD_TYPES = ['season', 'year', 'month']
+
+
+def one_hot_terms(df, metadata_columns):
+    """Return the one-hot term columns of a source DataFrame."""
+    return [col for col in df.columns
+            if col not in metadata_columns and not col.startswith('Unnamed')]
+
+
+def build_term_matrix(episode_keys, colors_df, subjects_df):
+    """
+    Align the color and subject one-hot matrices to the episode key table.
+    Returns (matrix, terms) where matrix is episodes x terms and terms is a
+    DataFrame of term_type/term for each column.
+    """
+    color_columns = one_hot_terms(colors_df, COLOR_METADATA_COLUMNS)
+    subject_columns = one_hot_terms(subjects_df, SUBJECT_METADATA_COLUMNS)
+
+    # Episodes missing from a source get an all-zero row for its terms
+    color_rows = colors_df[color_columns].reindex(episode_keys['colors_row']).fillna(0).to_numpy()
+    subject_rows = subjects_df[subject_columns].reindex(episode_keys['subjects_row']).fillna(0).to_numpy()
+    matrix = np.hstack([color_rows, subject_rows]).astype(np.int64)
+
+    terms = pd.DataFrame({
+        'term_type': ['color'] * len(color_columns) + ['subject'] * len(subject_columns),
+        'term': [col.replace('_', ' ') for col in color_columns]
+                + [col.replace('_', ' ').title() for col in subject_columns],
+    })
+    return matrix, terms
+
+
+def build_usage_rollup(matrix, terms, periods, period_type):
+    """Usage count and share of every term per period, from one matrix product."""
+    valid = periods.notna().to_numpy()
+    codes, labels = pd.factorize(periods[valid], sort=True)
+    indicator = np.zeros((len(codes), len(labels)), dtype=np.int64)
+    indicator[np.arange(len(codes)), codes] = 1
+
+    counts = indicator.T @ matrix[valid]          # periods x terms
+    episodes = indicator.sum(axis=0)              # episodes per period
+    shares = counts / episodes[:, None]
+
+    period_index, term_index = np.indices(counts.shape)
+    return pd.DataFrame({
+        'term_type': terms['term_type'].to_numpy()[term_index.ravel()],
+        'term': terms['term'].to_numpy()[term_index.ravel()],
+        'period_type': period_type,
+        'period': np.asarray(labels, dtype=np.int64)[period_index.ravel()],
+        'usage_count': counts.ravel(),
+        'episode_count': episodes[period_index.ravel()],
+        'share': shares.ravel(),
+    })
+
+
+def build_cooccurrence(matrix, terms):
+    """Number of episodes each pair of terms appears in together, stored in both directions."""
+    counts = matrix.T @ matrix
+    np.fill_diagonal(counts, 0)
+    a, b = np.nonzero(counts)
+    return pd.DataFrame({
+        'term_type_a': terms['term_type'].to_numpy()[a],
+        'term_a': terms['term'].to_numpy()[a],
+        'term_type_b': terms['term_type'].to_numpy()[b],
+        'term_b': terms['term'].to_numpy()[b],
+        'episode_count': counts[a, b],
+    })
+
+
+def build_rollups(episode_keys, colors_df, subjects_df):
+    """Build every analytics rollup in one pass over the one-hot matrices."""
+    matrix, terms = build_term_matrix(episode_keys, colors_df, subjects_df)
+    air_dates = pd.to_datetime(episode_keys['air_date'], errors='coerce')
+    periods = {
+        'season': episode_keys['season_number'],
+        'year': air_dates.dt.year,
+        'month': air_dates.dt.month,
+    }
+    usage = pd.concat([build_usage_rollup(matrix, terms, periods[period_type], period_type)
+                       for period_type in PERIOD_TYPES], ignore_index=True)
+    return usage, build_cooccurrence(matrix, terms)
+
+
+def write_rollups(session, usage, cooccurrence):
+    """Replace the rollup tables inside the caller's write transaction."""
+    execute(session, "DELETE FROM TermUsageRollup")
+    execute(session, """
+        INSERT INTO TermUsageRollup (term_type, term, period_type, period, usage_count, episode_count, share)
+        VALUES (:term_type, :term, :period_type, :period, :usage_count, :episode_count, :share)
+    """, usage.astype(object).to_dict('records'))
+
+    execute(session, "DELETE FROM TermCooccurrence")
+    execute(session, """
+        INSERT INTO TermCooccurrence (term_type_a, term_a, term_type_b, term_b, episode_count)
+        VALUES (:term_type_a, :term_a, :term_type_b, :term_b, :episode_count)
+    """, cooccurrence.astype(object).to_dict('records'))
+
+    print(f"Wrote {len(usage)} usage rollup rows and {len(cooccurrence)} co-occurrence rows.")
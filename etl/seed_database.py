@@ -1,10 +1,9 @@
 import os
 import csv
-import re
-from datetime import datetime
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from urllib.parse import quote_plus
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.sql import execute
 
 # -- File paths --
 DATA_FOLDER = "../data"  # relative path from ETL folder
@@ -12,21 +11,14 @@ COLORS_FILE = os.path.join(DATA_FOLDER, "colors_used.csv")
 EPISODES_FILE = os.path.join(DATA_FOLDER, "episodes_dates.csv")
 SUBJECTS_FILE = os.path.join(DATA_FOLDER, "subject_matter.csv")
 
-# -- Database connection --
-DB_USER = os.environ.get('DB_USER', 'postgres')
-DB_PASSWORD = os.environ.get('DB_PASSWORD', 'password')
-DB_HOST = os.environ.get('DB_HOST', 'localhost')
-DB_PORT = os.environ.get('DB_PORT', '5432')
-DB_NAME = os.environ.get('DB_NAME', 'joy_of_painting')
-
-password = quote_plus(DB_PASSWORD)
-connection_string = f"postgresql://{DB_USER}:{password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(connection_string)
-Session = sessionmaker(bind=engine)
+# -- Database connection (seeding always writes to the primary, connects on first use) --
+def write_session():
+    from config.database import get_router
+    return get_router().write_session()
 
 # -- Insert Colors --
 def insert_colors():
-    session = Session()
+    session = write_session()
     inserted = 0
 
     with open(COLORS_FILE, newline='', encoding='utf-8') as csvfile:
@@ -38,73 +30,60 @@ def insert_colors():
             color_hexes = [h.strip() for h in hex_codes]
 
             for cname, chex in zip(color_names, color_hexes):
-                insert_stmt = text("""
+                insert_stmt = """
                     INSERT INTO Color (name, hex_code)
                     VALUES (:name, :hex_code)
                     ON CONFLICT (name) DO NOTHING
-                """)
-                session.execute(insert_stmt, {"name": cname, "hex_code": chex})
+                """
+                execute(session, insert_stmt, {"name": cname, "hex_code": chex})
                 inserted += 1
 
     session.commit()
     session.close()
     print(f"Inserted {inserted} colors.")
 
+# -- Reconcile Episodes --
+def load_episode_keys():
+    from reconcile import build_episode_keys, read_colors, read_episode_dates, read_subjects
+    episode_keys = build_episode_keys(read_colors(COLORS_FILE), read_subjects(SUBJECTS_FILE), read_episode_dates(EPISODES_FILE))
+    fuzzy = (episode_keys['match_method'] == 'fuzzy').sum()
+    unmatched = episode_keys['match_method'].isna().sum()
+    print(f"Reconciled {len(episode_keys)} episodes ({fuzzy} fuzzy, {unmatched} without air date).")
+    return episode_keys
+
 # -- Insert Episodes --
-def insert_episodes():
-    session = Session()
+def insert_episodes(episode_keys):
+    import pandas as pd
+    session = write_session()
     inserted = 0
-    episode_ids = []
-
-    with open(EPISODES_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-
-            # Extract title and date using regex
-            title_match = re.match(r'"?(.*?)"?\s*\((.*?)\)', line)
-            if not title_match:
-                print(f"Skipping line (cannot parse title/date): {line}")
-                continue
-
-            title = title_match.group(1).strip()
-            date_str = title_match.group(2).strip()
-
-            try:
-                air_date = datetime.strptime(date_str, "%B %d, %Y").date()
-            except ValueError:
-                print(f"Skipping line (invalid date format): {line}")
-                continue
-
-            # Assign season and episode numbers sequentially
-            season_number = 1
-            episode_number = inserted + 1
-
-            insert_stmt = text("""
-                INSERT INTO Episode (title, season_number, episode_number, air_date)
-                VALUES (:title, :season_number, :episode_number, :air_date)
-                ON CONFLICT (season_number, episode_number) DO NOTHING
-                RETURNING id
-            """)
-            result = session.execute(insert_stmt, {
-                "title": title,
-                "season_number": season_number,
-                "episode_number": episode_number,
-                "air_date": air_date
-            }).fetchone()
-
-            if result:
-                episode_ids.append(result[0])
-            else:
-                # fetch existing ID if already exists
-                result = session.execute(text("""
-                    SELECT id FROM Episode WHERE season_number = :season AND episode_number = :episode
-                """), {"season": season_number, "episode": episode_number}).fetchone()
-                if result:
-                    episode_ids.append(result[0])
-
-            inserted += 1
+    episode_ids = {}
+
+    for row in episode_keys.itertuples(index=False):
+        if pd.isna(row.air_date):
+            print(f"Skipping episode (no air date): {row.episode_key} {row.title}")
+            continue
+
+        insert_stmt = """
+            INSERT INTO Episode (title, season_number, episode_number, air_date, youtube_url, image_url)
+            VALUES (:title, :season_number, :episode_number, :air_date, :youtube_url, :image_url)
+            ON CONFLICT (season_number, episode_number) DO UPDATE SET
+                title = :title,
+                air_date = :air_date,
+                youtube_url = COALESCE(:youtube_url, Episode.youtube_url),
+                image_url = COALESCE(:image_url, Episode.image_url)
+            RETURNING id
+        """
+        result = execute(session, insert_stmt, {
+            "title": row.title,
+            "season_number": int(row.season_number),
+            "episode_number": int(row.episode_number),
+            "air_date": row.air_date,
+            "youtube_url": row.youtube_url,
+            "image_url": row.image_url
+        }).fetchone()
+
+        episode_ids[row.episode_key] = result[0]
+        inserted += 1
 
     session.commit()
     session.close()
@@ -113,7 +92,7 @@ def insert_episodes():
 
 # -- Insert Subjects --
 def insert_subjects():
-    session = Session()
+    session = write_session()
     inserted = 0
 
     with open(SUBJECTS_FILE, newline='', encoding='utf-8') as csvfile:
@@ -125,11 +104,11 @@ def insert_subjects():
                 if value.strip() == "1":
                     subject_name = col_name.replace("_", " ").title()
                     # Insert subject if not exists
-                    session.execute(text("""
+                    execute(session, """
                         INSERT INTO SubjectMatter (name)
                         VALUES (:name)
                         ON CONFLICT (name) DO NOTHING
-                    """), {"name": subject_name})
+                    """, {"name": subject_name})
                     inserted += 1
 
     session.commit()
@@ -137,35 +116,30 @@ def insert_subjects():
     print(f"Inserted {inserted} subjects.")
 
 # -- Link Episodes to Colors --
-def link_episodes_colors():
-    session = Session()
+def link_episodes_colors(episode_ids):
+    from reconcile import episode_key
+    session = write_session()
     inserted = 0
+    color_ids = dict(execute(session, "SELECT name, id FROM Color").fetchall())
 
     with open(COLORS_FILE, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
-            season = int(row['season'])
-            episode = int(row['episode'])
-            # Fetch episode_id
-            result = session.execute(text("""
-                SELECT id FROM Episode
-                WHERE season_number = :season AND episode_number = :episode
-            """), {"season": season, "episode": episode}).fetchone()
-            if not result:
+            episode_id = episode_ids.get(episode_key(row['season'], row['episode']))
+            if episode_id is None:
                 continue
-            episode_id = result[0]
 
             color_names = row['colors'].strip().replace("[","").replace("]","").replace("'", "").split(",")
             color_names = [c.strip() for c in color_names]
 
             for cname in color_names:
-                color_id = session.execute(text("SELECT id FROM Color WHERE name = :name"), {"name": cname}).fetchone()
+                color_id = color_ids.get(cname)
                 if color_id:
-                    session.execute(text("""
+                    execute(session, """
                         INSERT INTO EpisodeColor (episode_id, color_id)
                         VALUES (:episode_id, :color_id)
                         ON CONFLICT (episode_id, color_id) DO NOTHING
-                    """), {"episode_id": episode_id, "color_id": color_id[0]})
+                    """, {"episode_id": episode_id, "color_id": color_id})
                     inserted += 1
 
     session.commit()
@@ -173,49 +147,60 @@ def link_episodes_colors():
     print(f"Linked {inserted} episode-color relations.")
 
 # -- Link Episodes to Subjects --
-def link_episodes_subjects():
-    session = Session()
+def link_episodes_subjects(episode_ids, episode_keys):
+    from reconcile import read_subjects
+    session = write_session()
     inserted = 0
-
-    with open(SUBJECTS_FILE, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            ep_code = row['EPISODE']
-            title = row['TITLE'].strip('"')
-            # Fetch episode_id
-            result = session.execute(text("""
-                SELECT id FROM Episode
-                WHERE title ILIKE :title
-            """), {"title": title}).fetchone()
-            if not result:
-                continue
-            episode_id = result[0]
-
-            for col_name, value in row.items():
-                if col_name in ['EPISODE', 'TITLE']:
-                    continue
-                if value.strip() == "1":
-                    subject_name = col_name.replace("_", " ").title()
-                    subject_id = session.execute(text("""
-                        SELECT id FROM SubjectMatter WHERE name = :name
-                    """), {"name": subject_name}).fetchone()
-                    if subject_id:
-                        session.execute(text("""
-                            INSERT INTO EpisodeSubject (episode_id, subject_id)
-                            VALUES (:episode_id, :subject_id)
-                            ON CONFLICT (episode_id, subject_id) DO NOTHING
-                        """), {"episode_id": episode_id, "subject_id": subject_id[0]})
-                        inserted += 1
+    subject_ids = dict(execute(session, "SELECT name, id FROM SubjectMatter").fetchall())
+
+    # Same reader as load_episode_keys, so row labels line up with subjects_row
+    subjects_df = read_subjects(SUBJECTS_FILE)
+    row_keys = dict(zip(episode_keys['subjects_row'], episode_keys['episode_key']))
+    subject_columns = [col for col in subjects_df.columns if col not in ['EPISODE', 'TITLE']]
+
+    for idx, row in subjects_df.iterrows():
+        episode_id = episode_ids.get(row_keys.get(idx))
+        if episode_id is None:
+            continue
+
+        for col_name in subject_columns:
+            if row[col_name] == 1:
+                subject_name = col_name.replace("_", " ").title()
+                subject_id = subject_ids.get(subject_name)
+                if subject_id:
+                    execute(session, """
+                        INSERT INTO EpisodeSubject (episode_id, subject_id)
+                        VALUES (:episode_id, :subject_id)
+                        ON CONFLICT (episode_id, subject_id) DO NOTHING
+                    """, {"episode_id": episode_id, "subject_id": subject_id})
+                    inserted += 1
 
     session.commit()
     session.close()
     print(f"Linked {inserted} episode-subject relations.")
 
+# -- Refresh Analytics Rollups and Bump Dataset Generation --
+def refresh_rollups(episode_keys):
+    from config.database import get_router
+    from reconcile import read_colors, read_subjects
+    from rollups import build_rollups, write_rollups
+    session = write_session()
+    usage, cooccurrence = build_rollups(episode_keys, read_colors(COLORS_FILE), read_subjects(SUBJECTS_FILE))
+    write_rollups(session, usage, cooccurrence)
+    # Same transaction, so replicas never see new rollups under the old generation
+    generation = get_router().bump_generation(session)
+    session.commit()
+    session.close()
+    if generation is not None:
+        print(f"Dataset generation is now {generation}.")
+
 # ---------- Run all ----------
 if __name__ == "__main__":
+    episode_keys = load_episode_keys()
     insert_colors()
-    insert_episodes()
+    episode_ids = insert_episodes(episode_keys)
     insert_subjects()
-    link_episodes_colors()
-    link_episodes_subjects()
+    link_episodes_colors(episode_ids)
+    link_episodes_subjects(episode_ids, episode_keys)
+    refresh_rollups(episode_keys)
     print("Database seeding completed successfully!")